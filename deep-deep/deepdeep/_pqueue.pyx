@@ -0,0 +1,106 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+A C implementation of the int64 min-heap used by
+:class:`deepdeep.queues.RequestsPriorityQueue`.
+
+The algorithm is the same as in the heapq module, but keys are stored
+in a C array instead of a list of Python ints.
+"""
+from cpython.mem cimport PyMem_Realloc, PyMem_Free
+from libc.stdint cimport int64_t
+
+
+cdef class KeyHeap:
+    cdef int64_t* _keys
+    cdef Py_ssize_t _size
+    cdef Py_ssize_t _capacity
+
+    def __cinit__(self):
+        self._keys = NULL
+        self._size = 0
+        self._capacity = 0
+
+    def __dealloc__(self):
+        PyMem_Free(self._keys)
+
+    def push(self, int64_t key):
+        """ Push a key onto the heap """
+        self._reserve(self._size + 1)
+        self._keys[self._size] = key
+        self._size += 1
+        self._siftdown(0, self._size - 1)
+
+    def pop_min(self):
+        """ Pop and return the smallest key """
+        cdef int64_t last, result
+        if self._size == 0:
+            raise IndexError("pop from empty heap")
+        self._size -= 1
+        last = self._keys[self._size]
+        if self._size == 0:
+            return last
+        result = self._keys[0]
+        self._keys[0] = last
+        self._siftup(0)
+        return result
+
+    def top(self):
+        """ Return the smallest key without removing it """
+        if self._size == 0:
+            raise IndexError("heap is empty")
+        return self._keys[0]
+
+    def rebuild(self, const int64_t[::1] keys):
+        """ Replace heap contents with ``keys`` (an int64 numpy array) """
+        cdef Py_ssize_t i, n = keys.shape[0]
+        self._reserve(n)
+        for i in range(n):
+            self._keys[i] = keys[i]
+        self._size = n
+        for i in reversed(range(n // 2)):
+            self._siftup(i)
+
+    def __len__(self):
+        return self._size
+
+    cdef int _reserve(self, Py_ssize_t capacity) except -1:
+        cdef int64_t* keys
+        if capacity <= self._capacity:
+            return 0
+        capacity = max(capacity, 2 * self._capacity, 16)
+        keys = <int64_t*> PyMem_Realloc(self._keys, capacity * sizeof(int64_t))
+        if keys == NULL:
+            raise MemoryError()
+        self._keys = keys
+        self._capacity = capacity
+        return 0
+
+    cdef void _siftdown(self, Py_ssize_t startpos, Py_ssize_t pos):
+        # move a key at ``pos`` up until its parent is not greater
+        cdef int64_t newitem = self._keys[pos]
+        cdef Py_ssize_t parentpos
+        while pos > startpos:
+            parentpos = (pos - 1) >> 1
+            if newitem < self._keys[parentpos]:
+                self._keys[pos] = self._keys[parentpos]
+                pos = parentpos
+                continue
+            break
+        self._keys[pos] = newitem
+
+    cdef void _siftup(self, Py_ssize_t pos):
+        # move the smaller child up until a leaf is reached,
+        # then put the key there and sift it down
+        cdef Py_ssize_t endpos = self._size
+        cdef Py_ssize_t startpos = pos
+        cdef Py_ssize_t childpos = 2 * pos + 1
+        cdef int64_t newitem = self._keys[pos]
+        while childpos < endpos:
+            if (childpos + 1 < endpos and
+                    not self._keys[childpos] < self._keys[childpos + 1]):
+                childpos += 1
+            self._keys[pos] = self._keys[childpos]
+            pos = childpos
+            childpos = 2 * pos + 1
+        self._keys[pos] = newitem
+        self._siftdown(startpos, pos)
@@ -7,8 +7,7 @@ Crawl objective (goal) classes define how is reward computed.
 """
 from __future__ import absolute_import
 import abc
-from typing import Callable
-from collections import defaultdict
+from typing import Callable, Dict
 import logging
 
 from scrapy.http.response.text import TextResponse  # type: ignore
@@ -96,15 +95,22 @@ class RelevancyGoal(BaseGoal):
         self.max_requests_per_domain = max_requests_per_domain
         self.max_relevant_pages_per_domain = max_relevant_pages_per_domain
 
-        self.request_count = defaultdict(int)  # type: defaultdict
-        self.relevant_pages_found = defaultdict(int)  # type: defaultdict
+        self.request_count = {}  # type: Dict[str, int]
+        self.relevant_pages_found = {}  # type: Dict[str, int]
 
     def get_reward(self, response: Response) -> float:
+        # relevancy is often a classifier, so it is computed only once
+        # per response; per-domain counters are also updated only once.
+        relevancy = response.meta.get('_relevancy')
+        if relevancy is not None:
+            return relevancy
         relevancy = self.relevancy(response)
+        response.meta['_relevancy'] = relevancy
         domain = get_response_domain(response)
-        self.request_count[domain] += 1
+        self.request_count[domain] = self.request_count.get(domain, 0) + 1
         if relevancy >= self.relevancy_threshold:
-            self.relevant_pages_found[domain] += 1
+            self.relevant_pages_found[domain] = (
+                self.relevant_pages_found.get(domain, 0) + 1)
         return relevancy
 
     def is_achieved_for(self, domain: str):
@@ -116,12 +122,13 @@ class RelevancyGoal(BaseGoal):
     def _max_requests_reached(self, domain: str) -> bool:
         if self.max_requests_per_domain is None:
             return False
-        return self.request_count[domain] >= self.max_requests_per_domain
+        return self.request_count.get(domain, 0) >= self.max_requests_per_domain
 
     def _max_relevant_pages_reached(self, domain: str) -> bool:
         if self.max_relevant_pages_per_domain is None:
             return False
-        return self.relevant_pages_found[domain] >= self.max_relevant_pages_per_domain
+        return (self.relevant_pages_found.get(domain, 0) >=
+                self.max_relevant_pages_per_domain)
 
 
 class FormasaurusGoal(BaseGoal):
@@ -1,21 +1,54 @@
 # -*- coding: utf-8 -*-
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 from typing import Iterator, Dict, Optional, Set, Iterable, List, Tuple
 
+from lxml import etree  # type: ignore
 from parsel import Selector  # type: ignore
 from scrapy.http import TextResponse  # type: ignore
 from scrapy.linkextractors import IGNORED_EXTENSIONS  # type: ignore
 from scrapy.utils.response import get_base_url  # type: ignore
-from scrapy.utils.url import url_has_any_extension  # type: ignore
 from w3lib.html import strip_html5_whitespace  # type: ignore
 
 from deepdeep.utils import canonicalize_url, get_domain
 
 _NEW_IGNORED = {'7z', '7zip', 'xz', 'gz', 'tar', 'bz2', 'cdr', 'apk'}
 _IGNORED = set(IGNORED_EXTENSIONS) | _NEW_IGNORED
-_IGNORED = {'.' + e for e in _IGNORED}
-
+_IGNORED_SCHEMES = {'tel', 'skype', 'fb', 'javascript'}
+
+# A single regex to filter out links with ignored schemes or with
+# ignored extensions in URL path. It matches:
+#
+# * "mailto:" anywhere in URL;
+# * other ignored schemes at the start of URL;
+# * an ignored extension at the end of the last path segment,
+#   optionally followed by ";params" (like url_has_any_extension,
+#   which uses urlparse). Extracted URLs are absolute, so URL path
+#   starts after "scheme://netloc".
+_skip_link_search = re.compile(
+    r"mailto:|"
+    r"^(?:{schemes}):|"
+    r"^[a-z][a-z0-9+.-]*://[^/?#]*/(?:[^?#]*/)?[^/;?#]*"
+    r"\.(?:{extensions})(?:;[^/?#]*)?(?:[?#]|$)"
+    .format(
+        schemes='|'.join(sorted(_IGNORED_SCHEMES)),
+        extensions='|'.join(sorted(re.escape(e) for e in _IGNORED)),
+    ),
+    re.IGNORECASE,
+).search
+
+
+# XPath expressions are compiled once; they are evaluated on lxml elements
+# directly, without creating parsel Selectors for each link.
+_xp_links = etree.XPath('//a')
+_xp_link_text = etree.XPath('normalize-space(.)')
+_xp_img_alt = etree.XPath('./img/@alt')
+
+# <a> attributes which are kept in link dicts
+_LINK_ATTRS = ('href', 'class', 'rel', 'title', 'id')
+
+
+_http_host_match = re.compile(r"https?://[^/?#]*", re.IGNORECASE).match
 
 _js_link_search = re.compile(
     r"(javascript:)?location\.href=['\"](?P<url>.+)['\"]").search
@@ -29,7 +62,13 @@ def extract_js_link(href: str) -> Optional[str]:
     'http://www.facebook.com/rivervalleyvet'
     >>> extract_js_link("javascript:href='http://www.facebook.com/rivervalleyvet';") is None
     True
+    >>> extract_js_link("http://example.com") is None
+    True
     """
+    # most links are not JS links; a substring check is much cheaper
+    # than a regex search
+    if 'location.href=' not in href:
+        return None
     m = _js_link_search(href)
     if m:
         return m.group('url')
@@ -55,7 +94,7 @@ def _extract_link_dicts(
         'attrs': {
             '<attribute name>': '<value>',
             ...
-        },
+        },  # only href, class, rel, title and id attributes
         'inside_text': '<text inside link>',
         # 'before_text': '<text preceeding this link>',
     }
@@ -79,27 +118,21 @@ def _extract_link_dicts(
     """
     selector.remove_namespaces()
 
-    for a in selector.xpath('//a'):
+    for a in _xp_links(selector.root):
         link = {}  # type: Dict
 
-        attrs = a.root.attrib
+        attrs = a.attrib
         if 'href' not in attrs:
             continue
 
         href = strip_html5_whitespace(attrs['href'])
-        if 'mailto:' in href:
-            continue
-
         js_link = extract_js_link(href)
         if js_link:
             href = js_link
             link['js'] = True
 
-        if href.startswith(('tel:', 'skype:', 'fb:', 'javascript:')):
-            continue
-
         url = urljoin(base_url, href)
-        if url_has_any_extension(url, _IGNORED):
+        if _skip_link_search(url):
             continue
 
         if only_urls:
@@ -107,10 +140,11 @@ def _extract_link_dicts(
 
         else:
             link['url'] = url
-            link['attrs'] = dict(attrs)
+            link['attrs'] = {k: attrs[k] for k in _LINK_ATTRS if k in attrs}
 
-            link_text = a.xpath('normalize-space()').extract_first(default='')
-            img_link_text = a.xpath('./img/@alt').extract_first(default='')
+            link_text = _xp_link_text(a)
+            img_alts = _xp_img_alt(a)
+            img_link_text = str(img_alts[0]) if img_alts else ''
             link['inside_text'] = ' '.join([link_text, img_link_text]).strip()
 
             # TODO: fix before_text and add after_text
@@ -124,15 +158,49 @@ def iter_response_link_dicts(response: TextResponse,
     page_url = response.url
     domain_from = get_domain(response.url)
     base_url = get_base_url(response)
+    # Links on a page usually share a few hosts; cache domains
+    # by URL host to avoid parsing each URL with tldextract.
+    # response.meta['domain'] is not used here because it can be different
+    # from response.url domain after redirects.
+    host_domains = {_url_host(page_url): domain_from}
     for link in extract_link_dicts(response.selector, base_url):
-        link['domain_to'] = get_domain(link['url'])
-        if limit_by_domain and link['domain_to'] != domain_from:
+        host = _url_host(link['url'])
+        domain_to = host_domains.get(host)
+        if domain_to is None:
+            domain_to = host_domains[host] = get_domain(link['url'])
+        link['domain_to'] = domain_to
+        if limit_by_domain and domain_to != domain_from:
             continue
         link['domain_from'] = domain_from
         link['page_url'] = page_url
         yield link
 
 
+def _url_host(url: str) -> str:
+    """
+    Return "scheme://netloc" part of an absolute URL, or the URL itself
+    if it has no netloc. For http and https URLs it is cheaper than urlsplit.
+
+    >>> _url_host("http://example.com/foo/bar?baz")
+    'http://example.com'
+    >>> _url_host("https://example.com")
+    'https://example.com'
+    >>> _url_host("http://example.com?foo=/bar")
+    'http://example.com'
+    >>> _url_host("ftp://user@example.com:21/foo")
+    'ftp://user@example.com:21'
+    >>> _url_host("data:text/html,foo")
+    'data:text/html,foo'
+    """
+    m = _http_host_match(url)
+    if m:
+        return m.group()
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url
+    return parts.scheme + '://' + parts.netloc
+
+
 class DictLinkExtractor:
     """
     A custom link extractor. It returns link dicts instead of Link objects.
@@ -18,12 +18,12 @@ sample from them, :class:`RequestsPriorityQueue` is a per-domain queue
 which allows to update request priorities.
 """
 import heapq
-import itertools
 import random
 import csv
+from array import array
 from typing import (
     List, Any, Iterable, Optional, Callable, Dict, Iterator, Set, TextIO,
-    Sized,
+    Sized, Sequence,
 )
 
 import numpy as np  # type: ignore
@@ -43,6 +43,38 @@ def priority_to_score(prio: int) -> float:
     return prio / FLOAT_PRIORITY_MULTIPLIER
 
 
+# RequestsPriorityQueue heap keys are (-priority << 32) | order, where
+# order is an entry index (possibly inverted for LIFO queues) stored
+# in the lower 32 bits. Comparing keys compares priorities first.
+_ORDER_BITS = 32
+_ORDER_MASK = (1 << _ORDER_BITS) - 1
+
+
+class _PyKeyHeap(list):
+    """
+    Min-heap of int keys based on heapq; it is used when
+    deepdeep._pqueue C extension is not built.
+    """
+    def push(self, key: int) -> None:
+        heapq.heappush(self, key)
+
+    def pop_min(self) -> int:
+        return heapq.heappop(self)
+
+    def top(self) -> int:
+        return self[0]
+
+    def rebuild(self, keys: np.ndarray) -> None:
+        self[:] = keys.tolist()
+        heapq.heapify(self)
+
+
+try:
+    from deepdeep._pqueue import KeyHeap  # type: ignore
+except ImportError:
+    KeyHeap = _PyKeyHeap
+
+
 class QueueClosed(Exception):
     pass
 
@@ -56,140 +88,221 @@ class RequestsPriorityQueue(Sized):
 
     This queue allows to change request priorities. To do it
 
-    1. iterate over queue.entries;
+    1. iterate over queue.iter_active_entries();
     2. call queue.change_priority(entry, new_priority) for each entry;
     3. call queue.heapify()
 
     It also allows to remove a request from a queue using remove_entry,
     and limit queue size with maxsize argument (queue is trimmed when
     updating request priorities).
+
+    Entries are integer indices; they are only valid until the next
+    :meth:`pop`, :meth:`pop_random` or :meth:`heapify` call.
     """
 
     REMOVED = object()
 
-    REMOVED_PRIORITY = score_to_priority(15000)
     EMPTY_PRIORITY = score_to_priority(-15000)
 
     def __init__(self, fifo: bool=True, maxsize: Optional[int]=None) -> None:
-        # entries are lists of [int, int, scrapy.Request]
-        self.entries = []  # type: List[List]
-        step = 1 if fifo else -1
-        self.counter = itertools.count(step=step)
+        # Entries are stored as a structure of arrays: for an entry
+        # ``idx`` self._prio[idx] is a negated request priority and
+        # self._requests[idx] is a scrapy.Request (or REMOVED).
+        # Entries are appended in push order, so idx is also an insertion
+        # counter. Heap items are int keys packing (-priority, idx);
+        # priorities must fit in 32 bits.
+        self._prio = array('q')
+        self._requests = []  # type: List[Any]
+        self._heap = KeyHeap()
+        # Indices of active entries, in arbitrary order, and a position
+        # of each entry in self._active (-1 for removed entries).
+        # They allow to sample a random active entry in O(1).
+        self._active = array('i')
+        self._active_pos = array('i')
+        self._order_mask = 0 if fifo else _ORDER_MASK
         self.maxsize = maxsize
 
-    def push(self, request: scrapy.Request) -> List:
-        count = next(self.counter)
-        entry = [-request.priority, count, request]
-        heapq.heappush(self.entries, entry)
-        return entry
+    def push(self, request: scrapy.Request) -> int:
+        idx = len(self._requests)
+        neg_priority = -request.priority
+        self._prio.append(neg_priority)
+        self._requests.append(request)
+        self._active_pos.append(len(self._active))
+        self._active.append(idx)
+        self._heap.push((neg_priority << _ORDER_BITS) | (idx ^ self._order_mask))
+        return idx
 
     def pop(self) -> Optional[scrapy.Request]:
-        while self.entries:
-            priority, count, request = heapq.heappop(self.entries)
-            if request is not self.REMOVED:
+        while self._heap:
+            key = self._heap.pop_min()
+            if not self._key_is_stale(key):
+                request = self.remove_entry(self._key_index(key))
                 self._pop_empty()
+                self._maybe_compact()
                 return request
         return None
 
-    @classmethod
-    def change_priority(cls,
-                        entry: List,
-                        new_priority: int) -> None:
+    def change_priority(self, entry: int, new_priority: int) -> None:
         """
         Change priority of an existing entry.
 
-        ``entry`` is an item from :attr:`entries` attribute.
+        ``entry`` is an item from :meth:`iter_active_entries`.
 
         After priorities are changed it is necessary to call
         :meth:`heapify`.
         """
-        entry[0] = -new_priority
-        if cls.entry_is_active(entry):
-            entry[2].priority = new_priority
+        self._prio[entry] = -new_priority
+        if self.entry_is_active(entry):
+            self._requests[entry].priority = new_priority
 
-    @classmethod
-    def entry_is_active(cls, entry: List) -> bool:
-        return entry[2] is not cls.REMOVED
+    def entry_is_active(self, entry: int) -> bool:
+        return self._requests[entry] is not self.REMOVED
 
-    def iter_active_entries(self) -> Iterator[List]:
-        return (e for e in self.entries if self.entry_is_active(e))
+    def iter_active_entries(self) -> Iterator[int]:
+        """
+        Return all active entries.
+        The first entry is guaranteed to have top priority;
+        order of other entries is arbitrary.
+        """
+        self._pop_empty()
+        if not self._heap:
+            return
+        top = self._key_index(self._heap.top())
+        yield top
+        for idx in self._active.tolist():
+            if idx != top:
+                yield idx
 
     def update_all_priorities(self,
-                              compute_priority_func: Callable[[List[scrapy.Request]], List[int]]) -> None:
+                              compute_priority_func: Callable[[List[scrapy.Request]], Sequence[int]]) -> None:
         """
         Update all request priorities.
 
         ``compute_priority_func`` is a function which returns
-        new priority; it should accept a list of Requests and return a list of
-        integer priorities.
+        new priority; it should accept a list of Requests and return a list
+        (or a numpy array) of integer priorities.
         """
-        requests = list(self.iter_requests())
-        new_priorities = compute_priority_func(requests)
+        entries = np.fromiter(self.iter_active_entries(), dtype=np.int64)
+        requests = [self._requests[idx] for idx in entries.tolist()]
+        new_priorities = np.asarray(compute_priority_func(requests),
+                                    dtype=np.int64)
         n = len(new_priorities)
+        n_rm = 0
         if self.maxsize and n > self.maxsize:
             n_rm = n - self.maxsize
-            to_remove_idx = np.array(new_priorities).argpartition(n_rm)[:n_rm]
-            to_remove = np.zeros(n, dtype=np.bool)
-            to_remove[to_remove_idx] = True
-        else:
-            to_remove = itertools.repeat(False)
-        for entry, priority, remove in zip(self.iter_active_entries(),
-                                           new_priorities,
-                                           to_remove):
-            if remove:
-                self.remove_entry(entry)
-            else:
-                self.change_priority(entry, priority)
-        self.heapify()
-
-    def remove_entry(self, entry: List) -> scrapy.Request:
+            order = new_priorities.argpartition(n_rm)
+            for idx in entries[order[:n_rm]].tolist():
+                self.remove_entry(idx)
+            keep = order[n_rm:]
+            entries = entries[keep]
+            new_priorities = new_priorities[keep]
+
+        prio = np.frombuffer(self._prio, dtype=np.int64)
+        changed = np.flatnonzero(prio[entries] != -new_priorities)
+        entries = entries[changed]
+        new_priorities = new_priorities[changed]
+        prio[entries] = -new_priorities
+        del prio  # self._prio can't be resized while a view exists
+        entries_list = entries.tolist()
+        new_priorities_list = new_priorities.tolist()
+        for idx, priority in zip(entries_list, new_priorities_list):
+            self._requests[idx].priority = priority
+
+        if not n_rm and not entries_list:
+            return
+        if len(entries_list) * 4 > len(self._active):
+            self.heapify()
+            return
+
+        # Only a few priorities are changed: instead of rebuilding the heap,
+        # push new keys for changed entries; old keys become stale
+        # and are skipped when popped.
+        mask = self._order_mask
+        for idx, priority in zip(entries_list, new_priorities_list):
+            self._heap.push((-priority << _ORDER_BITS) | (idx ^ mask))
+        self._pop_empty()
+        self._maybe_compact()
+
+    def remove_entry(self, entry: int) -> scrapy.Request:
         """
         Mark an existing entry as removed.
-        ``entry`` is an item from :attr:`entries` attribute.
+        ``entry`` is an item from :meth:`iter_active_entries`.
         """
-        request = entry[2]
-        entry[2] = self.REMOVED
-        # move removed entry to the top at next heapify call
-        max_prio = 0 if not self.entries else -self.entries[0][0]
-        entry[0] = - (max_prio + self.REMOVED_PRIORITY)
+        request = self._requests[entry]
+        pos = self._active_pos[entry]
+        if pos < 0:
+            return request
+        # swap with the last active entry and shrink self._active
+        last = self._active[-1]
+        self._active[pos] = last
+        self._active_pos[last] = pos
+        self._active.pop()
+        self._active_pos[entry] = -1
+        self._requests[entry] = self.REMOVED
         return request
 
-    def pop_random(self, n_attempts: int=10) -> Optional[scrapy.Request]:
+    def pop_random(self) -> Optional[scrapy.Request]:
         """ Pop random entry from a queue """
-        self._pop_empty()
-        if not self.entries:
+        if not self._active:
             return None
-
-        # Because we've called _pop_empty it is guaranteed there is at least
-        # one non-removed entry in a queue (the one at the top).
-        for i in range(n_attempts):
-            entry = random.choice(self.entries)
-            if entry[2] is not self.REMOVED:
-                request = self.remove_entry(entry)
-                self._pop_empty()
-                return request
-        return None
+        idx = self._active[random.randrange(len(self._active))]
+        request = self.remove_entry(idx)
+        self._pop_empty()
+        self._maybe_compact()
+        return request
 
     def max_priority(self) -> int:
         """ Return maximum request priority in this queue """
-        if not self.entries:
+        if not self._heap:
             return self.EMPTY_PRIORITY
-        return -self.entries[0][0]
+        return -(self._heap.top() >> _ORDER_BITS)
 
     @property
     def next_request(self) -> Optional[scrapy.Request]:
-        if not self.entries:
+        if not self._heap:
             return None
-        return self.entries[0][2]
+        return self._requests[self._key_index(self._heap.top())]
 
     def heapify(self) -> None:
-        heapq.heapify(self.entries)
-        self._pop_empty()
+        """
+        Rebuild the heap after priority changes. Removed entries
+        are dropped and remaining entries are renumbered.
+        """
+        active = [idx for idx, request in enumerate(self._requests)
+                  if request is not self.REMOVED]
+        neg_priorities = np.frombuffer(self._prio, dtype=np.int64)[active]
+        self._prio = array('q', neg_priorities.tobytes())
+        self._requests = [self._requests[idx] for idx in active]
+        self._active = array('i', range(len(active)))
+        self._active_pos = array('i', range(len(active)))
+        order = np.arange(len(active), dtype=np.int64) ^ self._order_mask
+        self._heap.rebuild((neg_priorities << _ORDER_BITS) | order)
+
+    def _key_index(self, key: int) -> int:
+        return (key & _ORDER_MASK) ^ self._order_mask
+
+    def _key_is_stale(self, key: int) -> bool:
+        """
+        Return True if a heap key belongs to a removed entry, or if
+        entry priority has been changed after the key was pushed.
+        """
+        idx = self._key_index(key)
+        return (self._requests[idx] is self.REMOVED or
+                self._prio[idx] != key >> _ORDER_BITS)
 
     def _pop_empty(self) -> None:
-        """ Pop all removed entries from heap top """
-        while self.entries and self.next_request is self.REMOVED:
-            heapq.heappop(self.entries)
+        """ Pop all stale keys from heap top """
+        while self._heap and self._key_is_stale(self._heap.top()):
+            self._heap.pop_min()
+
+    def _maybe_compact(self) -> None:
+        """
+        Drop removed entries and stale heap keys
+        if they take most of the space.
+        """
+        size = max(len(self._requests), len(self._heap))
+        if size > 2 * len(self._active) + 1024:
+            self.heapify()
 
     def iter_requests(self) -> Iterable[scrapy.Request]:
         """
@@ -197,16 +310,16 @@ class RequestsPriorityQueue(Sized):
         The first request is guaranteed to have top priority;
         order of other requests is arbitrary.
         """
-        return (e[2] for e in self.iter_active_entries())
+        return (self._requests[idx] for idx in self.iter_active_entries())
 
     def __len__(self) -> int:
-        return len(self.entries)
+        return len(self._active)
 
     def nbytes(self) -> int:
         """
-        Memory taken by link vectors in requests stored in self.entries.
+        Memory taken by link vectors in requests stored in the queue.
         """
-        return sum(request_nbytes(request) for _, _, request in self.entries)
+        return sum(request_nbytes(request) for request in self.iter_requests())
 
 
 class BalancedPriorityQueue:
@@ -252,6 +365,18 @@ class BalancedPriorityQueue:
         self.balancing_temperature = balancing_temperature
         self._batch_size = batch_size
         self._buffer = []  # type: List[scrapy.Request]
+        # Max priorities of queues are cached in self._weights_buf,
+        # in self._slots order; only weights of slots from
+        # self._dirty_slots are recomputed before sampling.
+        # self._slots is rebuilt from self.queues when a queue is closed.
+        self._weights_buf = np.empty(16, dtype=np.float64)
+        # scratch buffer for slot probabilities, to avoid allocating
+        # a new array for each batch
+        self._softmax_buf = np.empty_like(self._weights_buf)
+        self._slots = []  # type: List[str]
+        self._slot_index = {}  # type: Dict[str, int]
+        self._dirty_slots = set()  # type: Set[str]
+        self._slots_dirty = False
 
     def push(self, request: scrapy.Request) -> None:
         slot = request.meta.get('scheduler_slot')
@@ -259,7 +384,10 @@ class BalancedPriorityQueue:
             raise QueueClosed()
         if slot not in self.queues:
             self.queues[slot] = self.queue_factory(slot)
+            self._slot_index[slot] = len(self._slots)
+            self._slots.append(slot)
         self.queues[slot].push(request)
+        self._dirty_slots.add(slot)
 
     def pop(self) -> Optional[scrapy.Request]:
         if not self._buffer:
@@ -281,14 +409,22 @@ class BalancedPriorityQueue:
 
     @log_time
     def _pop_many(self, n: int) -> List[scrapy.Request]:
-        all_slots = list(self.queues.keys())
+        weights = self._get_weights()
+        all_slots = self._slots
         if not all_slots:
             return []
 
-        weights = [q.max_priority() for q in self.queues.values()]
         temperature = FLOAT_PRIORITY_MULTIPLIER * self.balancing_temperature
-        p = softmax(weights, t=temperature)
-        chosen_slots = np.random.choice(all_slots, size=n, replace=True, p=p)
+        p = softmax(weights, t=temperature,
+                    out=self._softmax_buf[:len(weights)])
+
+        # Inverse CDF sampling; it is much faster than np.random.choice
+        # because slot names are never converted to a numpy object array.
+        # Weights can change after each pop, so cdf is not cached.
+        cdf = np.cumsum(p, out=p)
+        idx = np.searchsorted(cdf, np.random.random(n) * cdf[-1], side='right')
+        idx = np.minimum(idx, len(all_slots) - 1)
+        chosen_slots = [all_slots[i] for i in idx.tolist()]
 
         # It is not possible to get a required amount of requests
         # from some domain queues - high-priority domain can be chosen too many
@@ -301,8 +437,9 @@ class BalancedPriorityQueue:
         # to the batch. The amount of random requests is chosen to make
         # average ratio of random requests equal to ``eps``.
 
-        queues = np.asarray([self.queues[slot] for slot in chosen_slots])
+        queues = [self.queues[slot] for slot in chosen_slots]
         requests = [r for r in [q.pop() for q in queues] if r]
+        self._dirty_slots.update(chosen_slots)
 
         # XXX: n_random is not 100% correct because there can be not enough
         # requests to pop from random queues as well. But it doesn't look
@@ -312,12 +449,13 @@ class BalancedPriorityQueue:
             n=len(requests) * (1 + self.eps),
             p=self.eps
         )
-        random_queues = [
-            self.queues[slot]
-            for slot in np.random.choice(all_slots, size=n_random)
+        random_slots = [
+            all_slots[i]
+            for i in np.random.randint(len(all_slots), size=n_random).tolist()
         ]
-        for queue in random_queues:
-            request = queue.pop_random()
+        self._dirty_slots.update(random_slots)
+        for slot in random_slots:
+            request = self.queues[slot].pop_random()
             if request is not None:
                 request.meta['from_random_policy'] = True
                 requests.append(request)
@@ -327,11 +465,39 @@ class BalancedPriorityQueue:
         # print("======= Random requests: %d/%d" % (n_random, len(requests)))
         return requests
 
+    def _get_weights(self) -> np.ndarray:
+        """
+        Return max priorities of all queues, in self._slots order.
+        Only priorities of queues changed since the last call are recomputed.
+        """
+        if self._slots_dirty:
+            self._slots = list(self.queues.keys())
+            self._slot_index = {slot: idx for idx, slot in enumerate(self._slots)}
+            self._dirty_slots = set(self._slots)
+            self._slots_dirty = False
+
+        n_slots = len(self._slots)
+        if n_slots > len(self._weights_buf):
+            buf = np.empty(max(n_slots, 2 * len(self._weights_buf)),
+                           dtype=np.float64)
+            buf[:len(self._weights_buf)] = self._weights_buf
+            self._weights_buf = buf
+            self._softmax_buf = np.empty_like(buf)
+
+        buf = self._weights_buf
+        for slot in self._dirty_slots:
+            buf[self._slot_index[slot]] = self.queues[slot].max_priority()
+        self._dirty_slots.clear()
+        return buf[:n_slots]
+
     def get_active_slots(self) -> List[str]:
         return [key for key, queue in self.queues.items() if len(queue)]
 
     def get_queue(self, slot: str) -> RequestsPriorityQueue:
-        return self.queues[slot]
+        queue = self.queues[slot]
+        # queue is likely to be changed by a caller
+        self._dirty_slots.add(slot)
+        return queue
 
     def close_queue(self, slot: str) -> int:
         """
@@ -342,6 +508,7 @@ class BalancedPriorityQueue:
         """
         self.closed_slots.add(slot)
         queue = self.queues.pop(slot, None) or []
+        self._slots_dirty = True
         return len(queue)
 
     def debug_dump(self, fp: TextIO) -> None:
@@ -6,7 +6,6 @@ import abc
 import time
 import gzip
 import logging
-from weakref import WeakKeyDictionary
 
 import psutil  # type: ignore
 import tqdm  # type: ignore
@@ -29,7 +28,7 @@ from deepdeep.scheduler import Scheduler
 from deepdeep.spiders._base import BaseSpider
 from deepdeep.qlearning import QLearner
 from deepdeep.utils import set_request_domain, get_domain, log_time, chunks
-from deepdeep.vectorizers import LinkVectorizer, PageVectorizer
+from deepdeep.vectorizers import LinkVectorizer, PageVectorizer, PageHtml
 from deepdeep.goals import BaseGoal
 from deepdeep.metrics import ndcg_score
 
@@ -194,7 +193,6 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
         self.rewards = []  # type: List[float]
         self.steps_before_reschedule = 0
         self.goal = self.get_goal()
-        self._reward_cache = WeakKeyDictionary()  # type: WeakKeyDictionary
 
         self.crawled_domains = set()  # type: Set[str]
         self.relevant_domains = set()  # type: Set[str]
@@ -227,10 +225,14 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
         pass
 
     def get_reward(self, response: Response) -> float:
-        if response not in self._reward_cache:
-            score = self.goal.get_reward(response)
-            self._reward_cache[response] = score
-        return self._reward_cache[response]
+        # Reward is cached in response.meta: it has the same lifetime
+        # as the response, and computing a reward can be expensive
+        # and change goal state.
+        reward = response.meta.get('_reward')
+        if reward is None:
+            reward = self.goal.get_reward(response)
+            response.meta['_reward'] = reward
+        return reward
 
     def is_seed(self, r: Union[scrapy.Request, Response]) -> bool:
         return 'link_vector' not in r.meta
@@ -309,7 +311,7 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
 
         reward = 0
         if not self.is_seed(response):
-            reward = self.goal.get_reward(response)
+            reward = self.get_reward(response)
             self.update_node(response, {'reward': reward})
             self.total_reward += reward
             self.rewards.append(reward)
@@ -364,10 +366,23 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
         """ Convert response content to a feature vector """
         if hasattr(response, '_cached_page_vector'):
             return response._cached_page_vector
-        vec = self.page_vectorizer.transform([response.text])[0]
+        vec = self.page_vectorizer.transform([self._page_html(response)])[0]
         response._cached_page_vector = vec
         return vec
 
+    def _page_html(self, response: TextResponse) -> PageHtml:
+        """
+        Return response HTML; its text content is extracted once and shared
+        by the page vectorizer and relevancy functions.
+        """
+        if not hasattr(response, '_cached_page_html'):
+            response._cached_page_html = PageHtml(response.text)
+        return response._cached_page_html
+
+    def _page_text(self, response: TextResponse) -> str:
+        """ Return text content of the response """
+        return self._page_html(response).text
+
     def get_scheduler_queue(self):
         """
         This method is called by deepdeep.scheduler.Scheduler
@@ -408,7 +423,7 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
         scores_new = []
         scores_old = []
 
-        def request_priorities(requests: List[scrapy.Request]) -> List[int]:
+        def request_priorities(requests: List[scrapy.Request]) -> np.ndarray:
             priorities = np.ndarray(len(requests), dtype=int)
             old_priorities = np.zeros_like(priorities)
             vectors, indices = [], []
@@ -428,10 +443,6 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
             scores_new.append(priorities / FLOAT_PRIORITY_MULTIPLIER)
             scores_old.append(old_priorities / FLOAT_PRIORITY_MULTIPLIER)
 
-            # convert priorities to Python ints because scrapy.Request
-            # doesn't support numpy int types
-            priorities = [p.item() for p in priorities]
-
             # TODO: use _log_promising_link or remove it
             return priorities
 
@@ -576,7 +587,7 @@ class QSpider(BaseSpider, metaclass=abc.ABCMeta):
     def _debug_expected_vs_got(self, response: Response):
         if 'link' not in response.meta:
             return
-        reward = self.goal.get_reward(response)
+        reward = self.get_reward(response)
         self.logger.debug("\nGOT {:0.4f} (expected return was {:0.4f}) {}\n{}".format(
             reward,
             priority_to_score(response.request.priority),
@@ -7,7 +7,6 @@ from typing import Any, Dict, List, Optional
 
 import joblib  # type: ignore
 from scrapy.http import Response, TextResponse  # type: ignore
-import html_text  # type: ignore
 
 from .qspider import QSpider
 from deepdeep.goals import RelevancyGoal
@@ -94,11 +93,13 @@ class KeywordRelevancySpider(_RelevancySpider):
         self._save_params_json()
 
     def relevancy(self, response: Response) -> float:
-        from deepdeep.score_pages import keywords_response_relevancy
-        return keywords_response_relevancy(response,
-                                           pos_keywords=self.pos_keywords,
-                                           neg_keywords=self.neg_keywords,
-                                           max_ngram=self.max_ngram)
+        from deepdeep.score_pages import keyword_text_relevancy
+        if not isinstance(response, TextResponse):
+            return 0.0
+        return keyword_text_relevancy(self._page_text(response).lower(),
+                                      pos_keywords=self.pos_keywords,
+                                      neg_keywords=self.neg_keywords,
+                                      max_ngram=self.max_ngram)
 
 
 class ClassifierRelevancySpider(_RelevancySpider):
@@ -145,10 +146,10 @@ class ClassifierRelevancySpider(_RelevancySpider):
         if self.classifier_input == 'vector':
             x = self._page_vector(response)
         elif self.classifier_input == 'text':
-            x = html_text.extract_text(response.text)
+            x = self._page_text(response)
         elif self.classifier_input == 'text_url':
             x = {
-                'text': html_text.extract_text(response.text),
+                'text': self._page_text(response),
                 'url': response.url
             }
         elif self.classifier_input == 'html':
@@ -3,14 +3,21 @@ import logging
 import time
 import itertools
 import functools
-import collections
+import math
 from urllib.parse import unquote_plus, urlsplit
+from typing import Callable, Dict
 
 import numpy as np  # type: ignore
 from scipy.sparse.csr import csr_matrix  # type: ignore
 import tldextract  # type: ignore
 from scrapy.utils.url import canonicalize_url as _canonicalize_url  # type: ignore
 
+try:
+    from numba import njit  # type: ignore
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +34,9 @@ def dict_aggregate_max(*dicts):
     res = {}
     for dct in dicts:
         for key, value in dct.items():
-            res[key] = max(res.get(key, value), value)
+            current = res.get(key)
+            if current is None or value > current:
+                res[key] = value
     return res
 
 
@@ -36,7 +45,15 @@ def get_domain(url: str) -> str:
 
 
 def get_response_domain(response):
-    return response.meta.get('domain', get_domain(response.url))
+    """
+    Return response.meta['domain'] if it is set; otherwise compute
+    the domain from response.url and store it in response.meta.
+    """
+    domain = response.meta.get('domain')
+    if domain is None:
+        domain = get_domain(response.url)
+        response.meta['domain'] = domain
+    return domain
 
 
 def set_request_domain(request, domain):
@@ -64,10 +81,13 @@ def url_path_query(url: str) -> str:
     return unquote_plus(p.path + '?' + p.query).lower()
 
 
-def softmax(z, t=1.0):
+def softmax(z, t=1.0, out=None):
     """
     Softmax function with temperature.
 
+    If ``out`` is passed, result is written to this float64 array
+    instead of a newly allocated one.
+
     >>> softmax(np.zeros(4))
     array([ 0.25,  0.25,  0.25,  0.25])
     >>> softmax([])
@@ -80,9 +100,42 @@ def softmax(z, t=1.0):
     if not len(z):
         return np.array([])
 
-    z = np.asanyarray(z) / t
-    z_exp = np.exp(z - np.max(z))
-    return z_exp / z_exp.sum()
+    z = np.asarray(z, dtype=np.float64)
+    if out is None:
+        out = np.empty_like(z)
+    return _softmax_into(out, z, float(t))
+
+
+def _softmax_numpy(out, z, t):
+    np.subtract(z, z.max(), out=out)
+    out /= t
+    np.exp(out, out=out)
+    out /= out.sum()
+    return out
+
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _softmax_numba(out, z, t):
+        n = z.shape[0]
+        z_max = z[0]
+        for i in range(1, n):
+            if z[i] > z_max:
+                z_max = z[i]
+        total = 0.0
+        for i in range(n):
+            e = math.exp((z[i] - z_max) / t)
+            out[i] = e
+            total += e
+        for i in range(n):
+            out[i] /= total
+        return out
+
+    # compile the kernel at import time, not on the first scheduler pop
+    _softmax_numba(np.empty(1), np.zeros(1), 1.0)
+    _softmax_into = _softmax_numba  # type: Callable
+else:
+    _softmax_into = _softmax_numpy
 
 
 class MaxScores:
@@ -107,10 +160,11 @@ class MaxScores:
     """
     def __init__(self, default=0):
         self.default = default
-        self.scores = collections.defaultdict(lambda: default)
+        self.scores = {}  # type: Dict
 
     def update(self, key, value):
-        self.scores[key] = max(self.scores[key], value)
+        current = self.scores.get(key, self.default)
+        self.scores[key] = value if value > current else current
 
     def sum(self):
         return sum(self.scores.values())
@@ -121,9 +175,7 @@ class MaxScores:
         return self.sum() / len(self)
 
     def __getitem__(self, key):
-        if key not in self.scores:
-            return self.default
-        return self.scores[key]
+        return self.scores.get(key, self.default)
 
     def __len__(self):
         return len(self.scores)
@@ -141,9 +193,23 @@ def log_time(func):
     return wrapper
 
 
-@functools.lru_cache(maxsize=100000)
+_CANONICAL_URLS = {}  # type: Dict[str, str]
+_CANONICAL_URLS_MAXSIZE = 100000
+
+
 def canonicalize_url(url: str) -> str:
-    return _canonicalize_url(url)
+    """
+    Cached version of scrapy.utils.url.canonicalize_url.
+    A plain dict is cheaper than functools.lru_cache; it is reset
+    when it grows too large.
+    """
+    canonical = _CANONICAL_URLS.get(url)
+    if canonical is None:
+        canonical = _canonicalize_url(url)
+        if len(_CANONICAL_URLS) >= _CANONICAL_URLS_MAXSIZE:
+            _CANONICAL_URLS.clear()
+        _CANONICAL_URLS[url] = canonical
+    return canonical
 
 
 def csr_nbytes(m: csr_matrix) -> int:
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from itertools import chain
-from typing import Dict
+from typing import Dict, Optional
 
 import numpy as np  # type: ignore
 from sklearn.decomposition import LatentDirichletAllocation  # type: ignore
@@ -128,7 +128,7 @@ def _clean_url(link: Dict) -> str:
 
 
 def _clean_url_keep_domain(link: Dict) -> str:
-    return canonicalize_url(link.get('url'))
+    return canonicalize_url(link['url'])
 
 
 def _clean_page_url(link: Dict) -> str:
@@ -136,7 +136,7 @@ def _clean_page_url(link: Dict) -> str:
 
 
 def _clean_page_url_keep_domain(link: Dict) -> str:
-    return canonicalize_url(link.get('page_url'))
+    return canonicalize_url(link['page_url'])
 
 
 def _same_domain_feature(links):
@@ -145,5 +145,23 @@ def _same_domain_feature(links):
     ]).reshape((-1, 1))
 
 
+class PageHtml(str):
+    """
+    Page HTML which remembers its text content, so that HTML is parsed
+    and cleaned only once if the text is needed several times,
+    e.g. to compute a page vector and page relevancy.
+    PageVectorizer and LDAPageVctorizer accept it instead of plain HTML.
+    """
+    _text = None  # type: Optional[str]
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = html_text.extract_text(self)
+        return self._text
+
+
 def _html_text_lower(html: str) -> str:
+    if isinstance(html, PageHtml):
+        return html.text.lower()
     return html_text.extract_text(html).lower()
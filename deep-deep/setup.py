@@ -1,5 +1,20 @@
 #!/usr/bin/env python
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    # deepdeep.queues falls back to a pure-Python heap
+    ext_modules = []
+else:
+    ext_modules = cythonize(
+        [Extension('deepdeep._pqueue', ['deepdeep/_pqueue.pyx'])],
+        language_level=3,
+    )
+    # cythonize doesn't preserve the optional flag;
+    # a failed build shouldn't fail the installation.
+    for ext in ext_modules:
+        ext.optional = True
 
 setup(
     name='deep-deep',
@@ -10,6 +25,7 @@ setup(
     author='Mikhail Korobov',
     license='MIT',
     packages=find_packages(),
+    ext_modules=ext_modules,
     include_package_data=True,
     zip_safe=False,
     classifiers=[
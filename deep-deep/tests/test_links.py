@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from parsel import Selector  # type: ignore
+import pytest  # type: ignore
+
+from deepdeep.links import _skip_link_search, extract_link_dicts, extract_links
+
+
+@pytest.mark.parametrize(['url', 'skip'], [
+    ("http://example.com/foo", False),
+    ("http://example.com/", False),
+    ("http://example.com", False),
+
+    # ignored schemes
+    ("mailto:foo@example.com", True),
+    ("MailTo:foo@example.com", True),
+    ("http://example.com/?q=mailto:foo", True),
+    ("tel:123", True),
+    ("TEL:123", True),
+    ("skype:foo?call", True),
+    ("fb:foo", True),
+    ("javascript:void(0)", True),
+    ("JavaScript:void(0)", True),
+    ("http://example.com/tel:123", False),
+    ("http://example.com/?javascript:", False),
+
+    # ignored extensions
+    ("http://example.com/foo.pdf", True),
+    ("http://example.com/foo.PDF", True),
+    ("http://example.com/foo.pdf?bar", True),
+    ("http://example.com/foo.pdf#bar", True),
+    ("http://example.com/foo.pdf;bar", True),
+    ("http://example.com/foo.pdf;bar;baz", True),
+    ("http://example.com/a/b/foo.pdf", True),
+    ("http://example.com/a;b/foo.pdf", True),
+    ("http://example.com/.pdf", True),
+    ("http://example.com/foo.tar.gz", True),
+    ("http://example.com/foo.tar.gz?bar", True),
+    ("http://example.com/foo.jpg", True),
+    ("http://example.com/a.pdf/b", False),
+    ("http://example.com/a.pdf;b/c", False),
+    ("http://example.com/foo;bar.pdf", False),
+    ("http://example.com/foo.pdfx", False),
+    ("http://example.com/foo?f=bar.pdf", False),
+    ("http://example.com/foo#bar.pdf", False),
+    ("http://example.com?bar.pdf", False),
+    ("http://example.pdf", False),
+    ("http://example.pdf/", False),
+])
+def test_skip_link_search(url, skip):
+    assert bool(_skip_link_search(url)) == skip
+
+
+HTML = """
+<html><body>
+  <a href="/foo" title="Foo" onclick="foo()">Foo <img alt="bar"></a>
+  <a href="mailto:foo@example.com">mail</a>
+  <a href="/doc.pdf">pdf</a>
+  <a href="javascript:location.href='/js-link'">js</a>
+  <a href="javascript:location.href='/doc.PDF'">js pdf</a>
+  <a href="javascript:void(0)">noop</a>
+  <a name="no-href">anchor</a>
+</body></html>
+"""
+
+
+def test_extract_links():
+    links = extract_links(Selector(text=HTML), "http://example.com/")
+    assert list(links) == [
+        "http://example.com/foo",
+        "http://example.com/js-link",
+    ]
+
+
+def test_extract_link_dicts():
+    links = list(extract_link_dicts(Selector(text=HTML), "http://example.com/"))
+    assert len(links) == 2
+    assert links[0]['url'] == "http://example.com/foo"
+    assert links[0]['attrs'] == {'href': '/foo', 'title': 'Foo'}
+    assert 'js' not in links[0]
+    assert links[1]['url'] == "http://example.com/js-link"
+    assert links[1]['js'] is True
@@ -1,7 +1,64 @@
 # -*- coding: utf-8 -*-
+import heapq
+import random
+
+import numpy as np  # type: ignore
+import pytest  # type: ignore
 import scrapy  # type: ignore
 
-from deepdeep.queues import RequestsPriorityQueue
+from deepdeep import queues
+from deepdeep.queues import RequestsPriorityQueue, BalancedPriorityQueue
+
+try:
+    from deepdeep._pqueue import KeyHeap  # type: ignore
+except ImportError:
+    KeyHeap = None
+
+HEAPS = [
+    queues._PyKeyHeap,
+    pytest.param(KeyHeap, marks=pytest.mark.skipif(
+        KeyHeap is None, reason="deepdeep._pqueue is not built")),
+]
+
+
+@pytest.fixture(autouse=True, params=HEAPS, ids=['py', 'c'])
+def key_heap(request, monkeypatch):
+    """ Run each test with both heap implementations """
+    monkeypatch.setattr(queues, 'KeyHeap', request.param)
+    return request.param
+
+
+def test_key_heap(key_heap):
+    rng = random.Random(0)
+    heap = key_heap()
+    expected = []  # type: list
+    assert len(heap) == 0
+    for _ in range(500):
+        if expected and rng.random() < 0.4:
+            assert heap.pop_min() == heapq.heappop(expected)
+        else:
+            key = rng.randint(-2 ** 62, 2 ** 62)
+            heap.push(key)
+            heapq.heappush(expected, key)
+        assert len(heap) == len(expected)
+        if expected:
+            assert heap.top() == expected[0]
+
+    keys = [rng.randint(-2 ** 62, 2 ** 62) for _ in range(100)]
+    heap.rebuild(np.array(keys, dtype=np.int64))
+    assert len(heap) == 100
+    assert [heap.pop_min() for _ in range(100)] == sorted(keys)
+
+
+def test_key_heap_empty(key_heap):
+    heap = key_heap()
+    heap.push(-5)
+    heap.rebuild(np.array([], dtype=np.int64))
+    assert len(heap) == 0
+    with pytest.raises(IndexError):
+        heap.top()
+    with pytest.raises(IndexError):
+        heap.pop_min()
 
 
 def test_request_priority_queue():
@@ -12,7 +69,7 @@ def test_request_priority_queue():
     q.push(scrapy.Request('http://example.com/2', priority=2))
     q.push(scrapy.Request('http://example.com/0', priority=0))
 
-    assert -q.entries[0][0] == 2
+    assert q.max_priority() == 2
     assert len(q) == 5
 
     assert q.pop().url == "http://example.com/2"
@@ -24,6 +81,19 @@ def test_request_priority_queue():
     assert len(q) == 0
 
 
+def test_rpq_lifo():
+    q = RequestsPriorityQueue(fifo=False)
+    q.push(scrapy.Request('http://example.com/1', priority=1))
+    q.push(scrapy.Request('http://example.com/1/1', priority=1))
+    q.push(scrapy.Request('http://example.com/-1', priority=-1))
+    q.push(scrapy.Request('http://example.com/2', priority=2))
+
+    assert q.pop().url == "http://example.com/2"
+    assert q.pop().url == "http://example.com/1/1"
+    assert q.pop().url == "http://example.com/1"
+    assert q.pop().url == "http://example.com/-1"
+
+
 def test_rpq_pop_random():
     requests = [
         scrapy.Request('http://example.com/1', priority=1),
@@ -40,3 +110,61 @@ def test_rpq_pop_random():
 
     assert {req1.url, req2.url, req3.url} == {r.url for r in requests}
     assert q.pop_random() is None
+
+
+def test_rpq_update_all_priorities():
+    q = RequestsPriorityQueue(fifo=True, maxsize=3)
+    for i in range(5):
+        q.push(scrapy.Request('http://example.com/%d' % i, priority=i))
+    q.pop()  # remove "http://example.com/4"
+
+    # reverse priorities; the lowest-priority request is dropped
+    q.update_all_priorities(
+        lambda requests: [-r.priority for r in requests])
+    assert len(q) == 3
+    assert q.max_priority() == 0
+    assert [q.pop().url for _ in range(3)] == [
+        "http://example.com/0",
+        "http://example.com/1",
+        "http://example.com/2",
+    ]
+    assert q.pop() is None
+
+
+def test_rpq_update_few_priorities():
+    q = RequestsPriorityQueue(fifo=True)
+    for i in range(10):
+        q.push(scrapy.Request('http://example.com/%d' % i, priority=i))
+
+    def promote_first(requests):
+        return [100 if r.url.endswith('/0') else r.priority for r in requests]
+
+    q.update_all_priorities(promote_first)
+    assert len(q) == 10
+    assert q.max_priority() == 100
+    assert [q.pop().url for _ in range(3)] == [
+        "http://example.com/0",
+        "http://example.com/9",
+        "http://example.com/8",
+    ]
+    assert len(q) == 7
+
+
+def test_balanced_priority_queue():
+    q = BalancedPriorityQueue(lambda slot: RequestsPriorityQueue(fifo=True),
+                              batch_size=2)
+    urls = set()
+    for slot in ['a', 'b', 'c']:
+        for i in range(3):
+            url = 'http://%s.com/%d' % (slot, i)
+            urls.add(url)
+            q.push(scrapy.Request(url, priority=i,
+                                  meta={'scheduler_slot': slot}))
+    assert len(q) == 9
+
+    q.close_queue('c')
+    assert len(q) == 6
+
+    popped = [q.pop() for _ in range(6)]
+    assert {r.url for r in popped} == {u for u in urls if '//c.' not in u}
+    assert q.pop() is None
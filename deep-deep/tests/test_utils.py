@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np  # type: ignore
+import pytest  # type: ignore
+
+from deepdeep import utils
+from deepdeep.utils import softmax
+
+
+KERNELS = [
+    utils._softmax_numpy,
+    pytest.param(getattr(utils, '_softmax_numba', None),
+                 marks=pytest.mark.skipif(not utils._NUMBA_AVAILABLE,
+                                          reason="numba is not installed")),
+]
+
+
+@pytest.fixture(params=KERNELS, ids=['numpy', 'numba'])
+def softmax_kernel(request, monkeypatch):
+    """ Run a test with each softmax kernel """
+    monkeypatch.setattr(utils, '_softmax_into', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('t', [1.0, 0.1, 3.5])
+def test_softmax(softmax_kernel, t):
+    rng = np.random.RandomState(0)
+    for size in [1, 2, 7, 100]:
+        z = rng.uniform(-20, 20, size)
+        expected = np.exp((z - z.max()) / t)
+        expected /= expected.sum()
+
+        res = softmax(z, t)
+        assert np.allclose(res, expected)
+
+        # scratch buffer is larger than the input, as in
+        # BalancedPriorityQueue._pop_many
+        buf = np.full(size + 5, -1.0)
+        res = softmax(z, t, out=buf[:size])
+        assert np.shares_memory(res, buf)
+        assert np.allclose(buf[:size], expected)
+        assert (buf[size:] == -1).all()
+
+
+@pytest.mark.skipif(not utils._NUMBA_AVAILABLE,
+                    reason="numba is not installed")
+def test_softmax_numba_matches_numpy():
+    rng = np.random.RandomState(1)
+    for t in [1.0, 0.1, 3.5]:
+        for size in [1, 3, 50]:
+            z = rng.normal(scale=10, size=size)
+            out_numpy = utils._softmax_numpy(np.empty(size + 3)[:size], z, t)
+            out_numba = utils._softmax_numba(np.empty(size + 3)[:size], z, t)
+            assert np.allclose(out_numba, out_numpy, rtol=1e-12, atol=1e-15)
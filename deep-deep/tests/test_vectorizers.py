@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import html_text  # type: ignore
+
+from deepdeep.vectorizers import PageVectorizer, PageHtml
+
+
+HTML = "<html><body><p>Hello World</p><script>var x;</script></body></html>"
+
+
+def test_page_html():
+    html = PageHtml(HTML)
+    assert html == HTML
+    assert html.text == html_text.extract_text(HTML)
+
+
+def test_page_vectorizer_page_html(monkeypatch):
+    vec = PageVectorizer()
+    expected = vec.transform([HTML])
+
+    calls = []
+    extract_text = html_text.extract_text
+
+    def _extract_text(html):
+        calls.append(html)
+        return extract_text(html)
+    monkeypatch.setattr(html_text, 'extract_text', _extract_text)
+
+    html = PageHtml(HTML)
+    assert (vec.transform([html]) != expected).nnz == 0
+    assert html.text == "Hello World"
+    assert vec.transform([html]).nnz == expected.nnz
+    assert len(calls) == 1